@@ -1,10 +1,20 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 import os
+import time
+import logging
+import asyncio
 import tempfile
 import shutil
+import aiofiles
+import numpy as np
+from cachetools import TTLCache
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
 
 # Handle both relative and absolute imports
@@ -17,11 +27,15 @@ except ImportError:
     from documents.embeddings import ChromaDBManager
     from documents.document_processor import DocumentProcessor
 
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
 # Initialize FastAPI app
 app = FastAPI(
     title="House Finance Document API",
     description="API for managing and searching financial documents using ChromaDB",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -33,10 +47,42 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize components
+# Compress larger responses (search results) for clients that accept gzip
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+
+# Components are created in the startup handler so model and index loading
+# happens before the first request rather than during it
 config = Settings()
-chroma_manager = ChromaDBManager()
-doc_processor = DocumentProcessor("financial")
+chroma_manager: Optional[ChromaDBManager] = None
+doc_processor: Optional[DocumentProcessor] = None
+
+# Read size when streaming uploaded files to disk
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Documents only change on ingestion or reset, which clear this cache
+DOC_CACHE = TTLCache(maxsize=10_000, ttl=3600)
+
+# Worker processes for document processing, kept off the event loop
+INGEST_POOL: Optional[ProcessPoolExecutor] = None
+
+async def process_files(file_paths: List[Path]) -> List[Any]:
+    """Process documents in the ingestion pool.
+    
+    Returns a list of chunks or the raised exception for each file, in order.
+    """
+    loop = asyncio.get_running_loop()
+    return await asyncio.gather(
+        *[loop.run_in_executor(INGEST_POOL, doc_processor.process_document, file_path) for file_path in file_paths],
+        return_exceptions=True
+    )
+
+def add_chunks_in_batches(chunks: List[Any]) -> bool:
+    """Add chunks to ChromaDB in batches sized for the embedding provider's batch endpoint."""
+    batch_size = config.embed_batch_size
+    success = True
+    for i in range(0, len(chunks), batch_size):
+        success = chroma_manager.add_document_chunks(chunks[i:i + batch_size]) and success
+    return success
 
 # Pydantic models for API
 class SearchQuery(BaseModel):
@@ -55,6 +101,14 @@ class SearchResponse(BaseModel):
     results: List[SearchResult]
     total_results: int
 
+class SearchBatchQuery(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=100, description="Search query texts")
+    n_results: int = Field(default=5, ge=1, le=50, description="Number of results to return per query")
+    include_metadata: bool = Field(default=True, description="Include document metadata in results")
+
+class SearchBatchResponse(BaseModel):
+    results: List[SearchResponse]
+
 class DocumentInfo(BaseModel):
     filename: str
     size: int
@@ -72,6 +126,111 @@ class CollectionStats(BaseModel):
     embedding_model: str
     embedding_dimensions: int
 
+class SemanticQueryCache:
+    """Caches search results, matching new queries by embedding similarity."""
+    
+    def __init__(self, max_size: int, threshold: float, ttl: float):
+        """Initialize semantic query cache.
+        
+        Args:
+            max_size: Maximum number of cached queries (least recently used is evicted)
+            threshold: Minimum cosine similarity for a cached query to match
+            ttl: Seconds before a cached entry expires
+        """
+        self.max_size = max_size
+        self.threshold = threshold
+        self.ttl = ttl
+        self.clear()
+    
+    def clear(self):
+        """Drop all cached entries."""
+        self._vectors = None  # Unit-length query embeddings, one row per entry
+        self._n_results = np.empty(0, dtype=np.int64)
+        self._include_metadata = np.empty(0, dtype=bool)
+        self._created = np.empty(0)
+        self._last_used = np.empty(0)
+        self._results: List[List[SearchResult]] = []
+    
+    @staticmethod
+    def normalize(embedding: List[float]) -> Optional[np.ndarray]:
+        """Return the unit-length query vector, or None if it cannot be compared."""
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else None
+    
+    def get(self, query_vec: np.ndarray, n_results: int, include_metadata: bool) -> Optional[List[SearchResult]]:
+        """Return cached results for the most similar query, if similar enough."""
+        if self._vectors is None:
+            return None
+        
+        now = time.time()
+        sims = self._vectors @ query_vec
+        sims[(self._n_results != n_results)
+             | (self._include_metadata != include_metadata)
+             | (self._created < now - self.ttl)] = -np.inf
+        
+        best = int(np.argmax(sims))
+        if sims[best] < self.threshold:
+            return None
+        
+        self._last_used[best] = now
+        return self._results[best]
+    
+    def put(self, query_vec: np.ndarray, n_results: int, include_metadata: bool, results: List[SearchResult]):
+        """Cache results for a query, evicting an expired or least recently used entry when full."""
+        now = time.time()
+        
+        if self._vectors is None:
+            self._vectors = query_vec[np.newaxis, :].copy()
+        elif len(self._results) < self.max_size:
+            self._vectors = np.vstack([self._vectors, query_vec])
+        else:
+            idx = int(np.argmin(np.where(self._created < now - self.ttl, -np.inf, self._last_used)))
+            self._vectors[idx] = query_vec
+            self._n_results[idx] = n_results
+            self._include_metadata[idx] = include_metadata
+            self._created[idx] = now
+            self._last_used[idx] = now
+            self._results[idx] = results
+            return
+        
+        self._n_results = np.append(self._n_results, n_results)
+        self._include_metadata = np.append(self._include_metadata, include_metadata)
+        self._created = np.append(self._created, now)
+        self._last_used = np.append(self._last_used, now)
+        self._results.append(results)
+
+query_cache = SemanticQueryCache(
+    max_size=config.semantic_cache_size,
+    threshold=config.semantic_cache_threshold,
+    ttl=config.semantic_cache_ttl
+)
+
+# Application lifecycle
+
+@app.on_event("startup")
+async def initialize_components():
+    """Start ingestion workers and load ChromaDB before serving requests"""
+    global chroma_manager, doc_processor, INGEST_POOL
+    
+    # Start every worker up front, before ChromaDB and the embedding client
+    # open connections and threads that forked children should not inherit
+    INGEST_POOL = ProcessPoolExecutor(max_workers=config.max_workers)
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*[loop.run_in_executor(INGEST_POOL, os.getpid) for _ in range(config.max_workers)])
+    
+    doc_processor = DocumentProcessor("financial")
+    chroma_manager = ChromaDBManager()
+    
+    # One query loads the collection index and opens the embedding connection
+    chroma_manager.query_documents("warmup", n_results=1)
+
+@app.on_event("shutdown")
+def shutdown_ingest_pool():
+    """Stop ingestion worker processes"""
+    if INGEST_POOL is not None:
+        INGEST_POOL.shutdown(wait=False, cancel_futures=True)
+
 # API Endpoints
 
 @app.get("/", summary="Health Check")
@@ -98,38 +257,77 @@ async def get_stats():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting stats: {str(e)}")
 
-@app.post("/search", response_model=SearchResponse, summary="Search Documents")
-async def search_documents(search_query: SearchQuery):
-    """Search for documents using semantic similarity"""
-    try:
+def run_search(query: str, n_results: int, include_metadata: bool,
+               query_embedding: List[float]) -> SearchResponse:
+    """Answer one query from the semantic cache or ChromaDB given its embedding"""
+    query_vec = SemanticQueryCache.normalize(query_embedding)
+    
+    search_results = None
+    if query_vec is not None:
+        search_results = query_cache.get(query_vec, n_results, include_metadata)
+    
+    if search_results is None:
         results = chroma_manager.query_documents(
-            query_text=search_query.query,
-            n_results=search_query.n_results
+            query_text=query,
+            n_results=n_results,
+            query_embedding=query_embedding
         )
         
         search_results = []
-        for i, (doc_id, content, score, metadata) in enumerate(zip(
+        for doc_id, content, score, metadata in zip(
             results["ids"][0],
             results["documents"][0],
             results["distances"][0],
-            results["metadatas"][0] if search_query.include_metadata else [None] * len(results["ids"][0])
-        )):
+            results["metadatas"][0] if include_metadata else repeat(None)
+        ):
             search_results.append(SearchResult(
                 id=doc_id,
                 content=content,
                 score=1 - score,  # Convert distance to similarity score
-                metadata=metadata if search_query.include_metadata else None
+                metadata=metadata
             ))
         
-        return SearchResponse(
-            query=search_query.query,
-            results=search_results,
-            total_results=len(search_results)
+        if query_vec is not None and search_results:
+            query_cache.put(query_vec, n_results, include_metadata, search_results)
+    
+    return SearchResponse(
+        query=query,
+        results=search_results,
+        total_results=len(search_results)
+    )
+
+@app.post("/search", response_model=SearchResponse, summary="Search Documents")
+async def search_documents(search_query: SearchQuery):
+    """Search for documents using semantic similarity"""
+    try:
+        # Embed once and reuse the vector for the cache lookup and ChromaDB
+        query_embedding = chroma_manager.embedding_function([search_query.query])[0]
+        return run_search(
+            search_query.query,
+            search_query.n_results,
+            search_query.include_metadata,
+            query_embedding
         )
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error searching documents: {str(e)}")
 
+@app.post("/search-batch", response_model=SearchBatchResponse, summary="Search Documents in Batch")
+async def search_documents_batch(batch_query: SearchBatchQuery):
+    """Run several searches in one request, embedding all queries together"""
+    try:
+        # Duplicate queries share one embedding and one ChromaDB lookup
+        unique_queries = list(dict.fromkeys(batch_query.queries))
+        query_embeddings = chroma_manager.embedding_function(unique_queries)
+        responses = {
+            query: run_search(query, batch_query.n_results, batch_query.include_metadata, embedding)
+            for query, embedding in zip(unique_queries, query_embeddings)
+        }
+        return SearchBatchResponse(results=[responses[query] for query in batch_query.queries])
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching documents: {str(e)}")
+
 @app.post("/upload", response_model=IngestionResponse, summary="Upload and Process Documents")
 async def upload_documents(files: List[UploadFile] = File(...)):
     """Upload and process documents for ingestion into ChromaDB"""
@@ -148,42 +346,46 @@ async def upload_documents(files: List[UploadFile] = File(...)):
             if not file.filename:
                 continue
                 
+            # Stream to disk without blocking the event loop
             file_path = temp_path / file.filename
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
+            async with aiofiles.open(file_path, "wb") as buffer:
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    await buffer.write(chunk)
             saved_files.append(file_path)
         
         if not saved_files:
             raise HTTPException(status_code=400, detail="No valid files to process")
         
-        # Process documents
+        # Process documents in parallel (ChromaDB write below stays serialized)
         all_chunks = []
         document_info = []
         
-        for file_path in saved_files:
-            try:
-                chunks = doc_processor.process_document(file_path)
-                all_chunks.extend(chunks)
-                
-                # Get file info
-                file_stats = file_path.stat()
-                doc_info = DocumentInfo(
-                    filename=file_path.name,
-                    size=file_stats.st_size,
-                    chunks_created=len(chunks),
-                    metadata=chunks[0].metadata if chunks else {}
-                )
-                document_info.append(doc_info)
-                
-            except Exception as e:
-                print(f"Error processing {file_path.name}: {e}")
+        results = await process_files(saved_files)
+        
+        for file_path, chunks in zip(saved_files, results):
+            if isinstance(chunks, Exception):
+                logger.error("Error processing %s: %s", file_path.name, chunks)
                 continue
+            
+            all_chunks.extend(chunks)
+            
+            # Get file info
+            file_stats = file_path.stat()
+            doc_info = DocumentInfo(
+                filename=file_path.name,
+                size=file_stats.st_size,
+                chunks_created=len(chunks),
+                metadata=chunks[0].metadata if chunks else {}
+            )
+            document_info.append(doc_info)
         
         if not all_chunks:
             raise HTTPException(status_code=400, detail="No content could be extracted from files")
         
         # Add to ChromaDB
-        chroma_manager.add_document_chunks(all_chunks)
+        await asyncio.to_thread(add_chunks_in_batches, all_chunks)
+        query_cache.clear()
+        DOC_CACHE.clear()
         
         return IngestionResponse(
             success=True,
@@ -214,40 +416,48 @@ async def ingest_directory(directory_path: str = Query(..., description="Path to
         document_info = []
         errors = []
         
-        files_found = list(Path(directory_path).glob("*"))
-        print(f"DEBUG: Found {len(files_found)} files in directory: {directory_path}")
+        # scandir gives file types from the directory read; sizes cost one stat per file
+        # (instead of is_file() plus two stat() calls per file)
+        with os.scandir(directory_path) as entries:
+            file_sizes = {Path(entry.path): entry.stat().st_size for entry in entries if entry.is_file()}
+        logger.debug("Found %d files in directory: %s", len(file_sizes), directory_path)
+        
+        files_to_process = list(file_sizes)
         
-        for file_path in files_found:
-            if file_path.is_file():
-                print(f"DEBUG: Processing file: {file_path}")
-                try:
-                    chunks = doc_processor.process_document(file_path)
-                    print(f"DEBUG: Created {len(chunks)} chunks from {file_path.name}")
-                    all_chunks.extend(chunks)
-                    
-                    # Get file info
-                    file_stats = file_path.stat()
-                    doc_info = DocumentInfo(
-                        filename=file_path.name,
-                        size=file_stats.st_size,
-                        chunks_created=len(chunks),
-                        metadata=chunks[0].metadata if chunks else {}
-                    )
-                    document_info.append(doc_info)
-                    
-                except Exception as e:
-                    error_msg = f"Error processing {file_path.name}: {str(e)}"
-                    print(f"DEBUG: {error_msg}")
-                    errors.append(error_msg)
-                    continue
+        # Process documents in parallel (ChromaDB write below stays serialized)
+        if logger.isEnabledFor(logging.DEBUG):
+            for file_path in files_to_process:
+                logger.debug("Processing file: %s", file_path)
+        results = await process_files(files_to_process)
+        
+        for file_path, chunks in zip(files_to_process, results):
+            if isinstance(chunks, Exception):
+                error_msg = f"Error processing {file_path.name}: {str(chunks)}"
+                logger.error("%s", error_msg)
+                errors.append(error_msg)
+                continue
+            
+            logger.debug("Created %d chunks from %s", len(chunks), file_path.name)
+            all_chunks.extend(chunks)
+            
+            # Get file info
+            doc_info = DocumentInfo(
+                filename=file_path.name,
+                size=file_sizes[file_path],
+                chunks_created=len(chunks),
+                metadata=chunks[0].metadata if chunks else {}
+            )
+            document_info.append(doc_info)
         
         if not all_chunks:
             error_detail = f"No content could be extracted from directory. Errors: {errors}" if errors else "No content could be extracted from directory. No supported files found."
             raise HTTPException(status_code=400, detail=error_detail)
         
         # Add to ChromaDB
-        print(f"DEBUG: Adding {len(all_chunks)} chunks to ChromaDB")
-        success = chroma_manager.add_document_chunks(all_chunks)
+        logger.debug("Adding %d chunks to ChromaDB", len(all_chunks))
+        success = await asyncio.to_thread(add_chunks_in_batches, all_chunks)
+        query_cache.clear()
+        DOC_CACHE.clear()
         
         if not success:
             raise HTTPException(status_code=500, detail="Failed to add documents to ChromaDB")
@@ -268,6 +478,8 @@ async def reset_collection():
     """Reset the document collection (delete all documents)"""
     try:
         chroma_manager.reset_collection()
+        query_cache.clear()
+        DOC_CACHE.clear()
         return {"message": "Collection reset successfully", "success": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error resetting collection: {str(e)}")
@@ -276,17 +488,23 @@ async def reset_collection():
 async def get_document(document_id: str):
     """Get a specific document by its ID"""
     try:
+        document = DOC_CACHE.get(document_id)
+        if document is not None:
+            return document
+        
         # Query for specific document ID
         results = chroma_manager.collection.get(ids=[document_id])
         
         if not results["ids"]:
             raise HTTPException(status_code=404, detail="Document not found")
         
-        return {
+        document = {
             "id": results["ids"][0],
             "content": results["documents"][0],
             "metadata": results["metadatas"][0] if results["metadatas"] else None
         }
+        DOC_CACHE[document_id] = document
+        return document
     
     except HTTPException:
         raise
@@ -4,12 +4,29 @@ Handles document loading, chunking, and metadata extraction.
 """
 
 import os
+import mmap
 import hashlib
 from pathlib import Path
-from typing import List, Dict, Any, Tuple, Optional
+from typing import List, Dict, Any, Tuple, Optional, Iterator
 from dataclasses import dataclass
+from datetime import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 import re
 import logging
+import numpy as np
+
+# JIT-compile the sentence packing kernel when numba is installed
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    
+    def njit(*args, **kwargs):
+        """Fallback that leaves the kernel as plain NumPy code."""
+        return lambda func: func
 
 # Handle both relative and absolute imports
 try:
@@ -21,6 +38,62 @@ except ImportError:
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@njit(cache=True)
+def pack_sentences(lens: np.ndarray, chunk_size: int, chunk_overlap: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Greedily pack sentences into overlapping chunks.
+    
+    Each chunk extends as far as it can while staying within chunk_size, but it
+    always starts with at least one sentence from the previous chunk and always
+    adds at least one new sentence. So chunk_size is a target, not a hard cap: a
+    chunk exceeds it whenever the carried-over sentence(s) plus the next sentence
+    are longer than chunk_size, not only when a single sentence is.
+    
+    Args:
+        lens: Character length of each sentence
+        chunk_size: Target characters per chunk
+        chunk_overlap: Characters to repeat from the end of the previous chunk
+            (at least one sentence is repeated even if it is longer)
+        
+    Returns:
+        Start and end sentence indices of each chunk
+    """
+    n = lens.shape[0]
+    starts = np.empty(n, dtype=np.int64)
+    ends = np.empty(n, dtype=np.int64)
+    if n == 0:
+        return starts, ends
+    
+    # Cumulative length of each sentence plus its joining space
+    cum = np.zeros(n + 1, dtype=np.int64)
+    cum[1:] = np.cumsum(lens + 1)
+    
+    count = 0
+    start = 0
+    min_end = 1
+    while True:
+        # Last sentence whose joined text still fits in chunk_size,
+        # always advancing past the previous chunk by at least one sentence
+        end = np.searchsorted(cum, cum[start] + chunk_size + 1, side="right") - 1
+        end = min(max(end, min_end), n)
+        
+        starts[count] = start
+        ends[count] = end
+        count += 1
+        
+        if end == n:
+            break
+        
+        # Overlap with the trailing sentences that fit in chunk_overlap (at least 1)
+        overlap = np.searchsorted(np.cumsum(lens[start:end][::-1]), chunk_overlap, side="right")
+        start = end - max(overlap, 1)
+        min_end = end + 1
+    
+    return starts[:count], ends[:count]
+
+if NUMBA_AVAILABLE:
+    # Compile (or load the cached build) once at import rather than on the first document
+    pack_sentences(np.ones(2, dtype=np.int64), 1, 1)
+
 @dataclass
 class DocumentChunk:
     """Represents a document chunk with metadata."""
@@ -42,6 +115,16 @@ class DocumentProcessor:
         self.chunk_size = self.config.get("chunk_size", settings.chunk_size)
         self.chunk_overlap = self.config.get("chunk_overlap", settings.chunk_overlap)
         
+        # Precompiled metadata patterns; financial ones are fused into a single pass
+        self._re_fin = re.compile(
+            r'(?P<fy>fiscal year (?P<year>\d{4}))'
+            r'|(?P<dollar>\$[\d,]+)'
+            r'|(?P<dept>(?:department|office|division) of \w+)'
+        )
+        self._re_bill = re.compile(r'[HS]B\s*\d+')
+        self._re_section = re.compile(r'section \d+')
+        self._re_sent = re.compile(r'[^.!?]+')
+        
         logger.info(f"DocumentProcessor initialized for type: {doc_type}")
         logger.info(f"Chunk size: {self.chunk_size}, overlap: {self.chunk_overlap}")
     
@@ -63,9 +146,18 @@ class DocumentProcessor:
                 logger.warning(f"Unsupported file type: {file_path.suffix}")
                 return None
             
-            # Read text file
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
+            # Read text file, decoding straight from a memory map so the raw
+            # bytes are never copied onto the heap
+            with open(file_path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    content = ""
+                else:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        content = str(mm, 'utf-8', 'ignore')
+            
+            # Match text-mode newline handling
+            if '\r' in content:
+                content = content.replace('\r\n', '\n').replace('\r', '\n')
             
             logger.info(f"Loaded document: {file_path.name} ({len(content)} characters)")
             return content
@@ -74,6 +166,30 @@ class DocumentProcessor:
             logger.error(f"Failed to load document {file_path}: {str(e)}")
             return None
     
+    def iter_documents(self, file_paths: List[Path]) -> Iterator[Tuple[Path, Optional[str]]]:
+        """Load documents with overlapping reads, yielding them in order.
+        
+        At most settings.max_workers reads run ahead of the caller, so only a
+        handful of documents are held in memory at a time.
+        
+        Args:
+            file_paths: Paths to the document files
+            
+        Yields:
+            Tuples of (path, content), with content None if loading failed
+        """
+        paths = iter(file_paths)
+        with ThreadPoolExecutor(max_workers=settings.max_workers) as pool:
+            pending = deque(
+                (file_path, pool.submit(self.load_document, file_path))
+                for file_path in islice(paths, settings.max_workers)
+            )
+            while pending:
+                file_path, future = pending.popleft()
+                for next_path in islice(paths, 1):
+                    pending.append((next_path, pool.submit(self.load_document, next_path)))
+                yield file_path, future.result()
+    
     def extract_metadata(self, file_path: Path, content: str) -> Dict[str, Any]:
         """Extract metadata from document.
         
@@ -89,63 +205,72 @@ class DocumentProcessor:
             "filename": file_path.name,
             "file_size": len(content),
             "doc_type": self.doc_type,
-            "processed_at": str(Path.cwd())
+            "processed_at": datetime.now().isoformat()
         }
         
-        # Extract document-specific metadata based on type
+        # Extract document-specific metadata based on type, casing the content only once
         if self.doc_type == "financial":
-            metadata.update(self._extract_financial_metadata(content))
+            metadata.update(self._extract_financial_metadata(content, content.lower()))
         elif self.doc_type == "legislative":
-            metadata.update(self._extract_legislative_metadata(content))
+            metadata.update(self._extract_legislative_metadata(content, content.lower(), content.upper()))
         
         return metadata
     
-    def _extract_financial_metadata(self, content: str) -> Dict[str, Any]:
-        """Extract financial document specific metadata."""
+    def _extract_financial_metadata(self, content: str, low: str) -> Dict[str, Any]:
+        """Extract financial document specific metadata.
+        
+        Args:
+            content: Document content
+            low: Lowercased document content
+        """
         metadata = {}
         
         # Look for common financial patterns
-        if "house bill" in content.lower() or "hb" in content.lower():
+        if "house bill" in low or "hb" in low:
             metadata["document_category"] = "budget_bill"
         
-        # Look for fiscal year mentions
-        fy_matches = re.findall(r'fiscal year (\d{4})', content.lower())
-        if fy_matches:
-            metadata["fiscal_years"] = ", ".join(list(set(fy_matches)))
+        # Scan once for fiscal years, dollar amounts and department mentions
+        fiscal_years = set()
+        dollar_count = 0
+        departments = set()
+        for match in self._re_fin.finditer(low):
+            kind = match.lastgroup
+            if kind == "fy":
+                fiscal_years.add(match.group("year"))
+            elif kind == "dollar":
+                dollar_count += 1
+            else:
+                departments.add(match.group("dept"))
+        
+        if fiscal_years:
+            metadata["fiscal_years"] = ", ".join(fiscal_years)
         
-        # Look for dollar amounts
-        dollar_matches = re.findall(r'\$[\d,]+', content)
-        if dollar_matches:
+        if dollar_count:
             metadata["contains_financial_data"] = True
-            metadata["dollar_amount_count"] = len(dollar_matches)
-        
-        # Look for department mentions
-        dept_patterns = [
-            r'department of \w+',
-            r'office of \w+',
-            r'division of \w+'
-        ]
-        departments = []
-        for pattern in dept_patterns:
-            matches = re.findall(pattern, content.lower())
-            departments.extend(matches)
+            metadata["dollar_amount_count"] = dollar_count
         
         if departments:
-            metadata["departments"] = ", ".join(list(set(departments)))
+            metadata["departments"] = ", ".join(departments)
         
         return metadata
     
-    def _extract_legislative_metadata(self, content: str) -> Dict[str, Any]:
-        """Extract legislative document specific metadata."""
+    def _extract_legislative_metadata(self, content: str, low: str, up: str) -> Dict[str, Any]:
+        """Extract legislative document specific metadata.
+        
+        Args:
+            content: Document content
+            low: Lowercased document content
+            up: Uppercased document content
+        """
         metadata = {}
         
         # Look for bill numbers
-        bill_matches = re.findall(r'[HS]B\s*\d+', content.upper())
+        bill_matches = self._re_bill.findall(up)
         if bill_matches:
             metadata["bill_numbers"] = ", ".join(list(set(bill_matches)))
         
         # Look for section references
-        section_matches = re.findall(r'section \d+', content.lower())
+        section_matches = self._re_section.findall(low)
         if section_matches:
             metadata["section_count"] = len(set(section_matches))
         
@@ -165,39 +290,16 @@ class DocumentProcessor:
         
         # Simple sentence-aware chunking
         sentences = self._split_into_sentences(content)
+        lens = np.fromiter(map(len, sentences), dtype=np.int64, count=len(sentences))
+        starts, ends = pack_sentences(lens, self.chunk_size, self.chunk_overlap)
         
-        current_chunk = ""
-        current_sentences = []
-        chunk_num = 0
-        
-        for sentence in sentences:
-            # Check if adding this sentence would exceed chunk size
-            if len(current_chunk) + len(sentence) > self.chunk_size and current_chunk:
-                # Create chunk
-                chunk = self._create_chunk(
-                    current_chunk.strip(),
-                    metadata,
-                    chunk_num,
-                    current_sentences
-                )
-                chunks.append(chunk)
-                
-                # Start new chunk with overlap
-                overlap_sentences = current_sentences[-self._calculate_overlap_sentences(current_sentences):]
-                current_chunk = " ".join(overlap_sentences)
-                current_sentences = overlap_sentences.copy()
-                chunk_num += 1
-            
-            current_chunk += " " + sentence
-            current_sentences.append(sentence)
-        
-        # Add final chunk if there's remaining content
-        if current_chunk.strip():
+        for chunk_num, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+            chunk_sentences = sentences[start:end]
             chunk = self._create_chunk(
-                current_chunk.strip(),
+                " ".join(chunk_sentences),
                 metadata,
                 chunk_num,
-                current_sentences
+                chunk_sentences
             )
             chunks.append(chunk)
         
@@ -207,23 +309,8 @@ class DocumentProcessor:
     def _split_into_sentences(self, text: str) -> List[str]:
         """Split text into sentences."""
         # Simple sentence splitting - can be improved
-        sentences = re.split(r'[.!?]+', text)
-        return [s.strip() for s in sentences if s.strip()]
-    
-    def _calculate_overlap_sentences(self, sentences: List[str]) -> int:
-        """Calculate number of sentences to overlap."""
-        # Calculate overlap based on character count
-        overlap_chars = 0
-        overlap_count = 0
-        
-        for sentence in reversed(sentences):
-            if overlap_chars + len(sentence) <= self.chunk_overlap:
-                overlap_chars += len(sentence)
-                overlap_count += 1
-            else:
-                break
-        
-        return max(1, overlap_count)  # At least 1 sentence overlap
+        stripped = (match.group().strip() for match in self._re_sent.finditer(text))
+        return [sentence for sentence in stripped if sentence]
     
     def _create_chunk(self, content: str, base_metadata: Dict[str, Any], 
                      chunk_num: int, sentences: List[str]) -> DocumentChunk:
@@ -231,14 +318,15 @@ class DocumentProcessor:
         # Create unique chunk ID
         chunk_id = self._generate_chunk_id(base_metadata["filename"], chunk_num)
         
-        # Create chunk metadata
-        chunk_metadata = base_metadata.copy()
-        chunk_metadata.update({
+        # Create chunk metadata in a single dict build
+        chunk_metadata = {
+            **base_metadata,
             "chunk_number": chunk_num,
             "chunk_size": len(content),
             "sentence_count": len(sentences),
-            "chunk_id": chunk_id
-        })
+            "chunk_id": chunk_id,
+            "content_hash": hashlib.sha256(content.encode()).hexdigest()
+        }
         
         return DocumentChunk(
             content=content,
@@ -263,6 +351,18 @@ class DocumentProcessor:
         """
         # Load document
         content = self.load_document(file_path)
+        return self.process_content(file_path, content)
+    
+    def process_content(self, file_path: Path, content: Optional[str]) -> List[DocumentChunk]:
+        """Process already loaded document content into chunks.
+        
+        Args:
+            file_path: Path the content was loaded from
+            content: Document content, or None if loading failed
+            
+        Returns:
+            List of DocumentChunk objects
+        """
         if not content:
             return []
         
@@ -296,10 +396,10 @@ class DocumentProcessor:
         
         logger.info(f"Found {len(supported_files)} documents to process")
         
-        # Process each file
-        for file_path in supported_files:
+        # Read ahead a few files while processing each one as it arrives
+        for file_path, content in self.iter_documents(supported_files):
             logger.info(f"Processing: {file_path.name}")
-            chunks = self.process_document(file_path)
+            chunks = self.process_content(file_path, content)
             all_chunks.extend(chunks)
         
         logger.info(f"Total chunks created: {len(all_chunks)}")
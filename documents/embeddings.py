@@ -5,7 +5,12 @@ Integrates ChromaDB with Google AI embeddings for document storage and retrieval
 
 import os
 import time
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
 from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
 import chromadb
 from chromadb.config import Settings
 import google.generativeai as genai
@@ -22,6 +27,9 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Maximum number of texts per Google batch embedding request
+GOOGLE_EMBED_BATCH_LIMIT = 100
+
 class GoogleEmbeddingFunction:
     """Custom embedding function for Google AI embeddings."""
     
@@ -52,25 +60,132 @@ class GoogleEmbeddingFunction:
         """
         embeddings = []
         
-        for text in input:
+        for i in range(0, len(input), GOOGLE_EMBED_BATCH_LIMIT):
+            batch = input[i:i + GOOGLE_EMBED_BATCH_LIMIT]
             try:
-                # Generate embedding using Google AI
+                # Generate embeddings for the whole batch in one request
                 result = genai.embed_content(
                     model=f"models/{self.model_name}",
-                    content=text,
+                    content=batch,
                     task_type="retrieval_document"
                 )
-                embeddings.append(result['embedding'])
+                embeddings.extend(result['embedding'])
                 
                 # Add small delay to respect rate limits
                 time.sleep(0.1)
                 
             except Exception as e:
-                logger.error(f"Error generating embedding for text: {str(e)}")
-                # Return zero vector as fallback
-                embeddings.append([0.0] * 768)  # Default dimension for Google embeddings
+                logger.error(f"Error generating embeddings for batch, retrying texts individually: {str(e)}")
+                # Retry one text at a time so a failure only costs the texts that fail
+                embeddings.extend(self._embed_text(text) for text in batch)
         
         return embeddings
+    
+    def _embed_text(self, text: str) -> List[float]:
+        """Generate the embedding for a single text.
+        
+        Args:
+            text: Text to embed
+            
+        Returns:
+            Embedding vector, or a zero vector if the request failed
+        """
+        try:
+            result = genai.embed_content(
+                model=f"models/{self.model_name}",
+                content=text,
+                task_type="retrieval_document"
+            )
+            
+            # Add small delay to respect rate limits
+            time.sleep(0.1)
+            return result['embedding']
+            
+        except Exception as e:
+            logger.error(f"Error generating embedding for text: {str(e)}")
+            # Return zero vector as fallback
+            return [0.0] * 768  # Default dimension for Google embeddings
+
+class ChunkEmbeddingCache:
+    """Persistent SQLite cache of chunk embeddings keyed by content hash."""
+    
+    # Keep IN (...) lists below SQLite's bound parameter limit
+    _MAX_PARAMS = 500
+    
+    def __init__(self, db_path: Path, provider: str, model: str):
+        """Initialize embedding cache.
+        
+        Args:
+            db_path: Path to the SQLite database file
+            provider: Embedding provider the cached vectors belong to
+            model: Embedding model the cached vectors belong to
+        """
+        self.db_path = Path(db_path)
+        self.provider = provider
+        self.model = model
+        self._lock = threading.Lock()
+        
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embedding_cache ("
+            "hash TEXT NOT NULL, provider TEXT NOT NULL, model TEXT NOT NULL, vec BLOB NOT NULL, "
+            "PRIMARY KEY (hash, provider, model))"
+        )
+        self._conn.commit()
+        logger.info(f"Embedding cache initialized at: {self.db_path}")
+    
+    @staticmethod
+    def hash_content(content: str) -> str:
+        """Return the cache key for a chunk's content."""
+        return hashlib.sha256(content.encode()).hexdigest()
+    
+    def get_many(self, hashes: List[str]) -> Dict[str, List[float]]:
+        """Look up cached embeddings.
+        
+        Args:
+            hashes: Content hashes to look up
+            
+        Returns:
+            Dictionary mapping each cached hash to its embedding vector
+        """
+        found = {}
+        unique_hashes = list(dict.fromkeys(hashes))
+        
+        with self._lock:
+            for i in range(0, len(unique_hashes), self._MAX_PARAMS):
+                batch = unique_hashes[i:i + self._MAX_PARAMS]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT hash, vec FROM embedding_cache "
+                    f"WHERE provider = ? AND model = ? AND hash IN ({placeholders})",
+                    (self.provider, self.model, *batch)
+                )
+                for content_hash, vec in rows:
+                    found[content_hash] = np.frombuffer(vec, dtype=np.float32).tolist()
+        
+        return found
+    
+    def put_many(self, embeddings: Dict[str, List[float]]):
+        """Store embeddings in the cache.
+        
+        Args:
+            embeddings: Dictionary mapping content hashes to embedding vectors
+        """
+        rows = [
+            (content_hash, self.provider, self.model, np.asarray(vec, dtype=np.float32).tobytes())
+            for content_hash, vec in embeddings.items()
+            if any(vec)  # Never cache the zero-vector fallback for failed embeddings
+        ]
+        if not rows:
+            return
+        
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embedding_cache (hash, provider, model, vec) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
 
 class ChromaDBManager:
     """Manages ChromaDB operations with Google embeddings."""
@@ -82,9 +197,11 @@ class ChromaDBManager:
         self.client = None
         self.collection = None
         self.embedding_function = None
+        self.embedding_cache = None
         
         self._initialize_client()
         self._initialize_embedding_function()
+        self._initialize_embedding_cache()
         self._initialize_collection()
     
     def _initialize_client(self):
@@ -117,6 +234,19 @@ class ChromaDBManager:
             logger.error(f"Failed to initialize embedding function: {str(e)}")
             raise
     
+    def _initialize_embedding_cache(self):
+        """Initialize persistent chunk embedding cache."""
+        try:
+            self.embedding_cache = ChunkEmbeddingCache(
+                db_path=settings.embedding_cache_path,
+                provider=settings.embedding_provider,
+                model=settings.embedding_model
+            )
+            
+        except Exception as e:
+            logger.error(f"Failed to initialize embedding cache: {str(e)}")
+            raise
+    
     def _initialize_collection(self):
         """Initialize or get existing collection."""
         try:
@@ -141,13 +271,15 @@ class ChromaDBManager:
             logger.error(f"Failed to initialize collection: {str(e)}")
             raise
     
-    def add_documents(self, documents: List[str], metadatas: List[Dict[str, Any]], ids: List[str]) -> bool:
+    def add_documents(self, documents: List[str], metadatas: List[Dict[str, Any]], ids: List[str],
+                      embeddings: Optional[List[List[float]]] = None) -> bool:
         """Add documents to the collection.
         
         Args:
             documents: List of document texts
             metadatas: List of metadata dictionaries
             ids: List of unique document IDs
+            embeddings: Optional precomputed embeddings (computed by ChromaDB if omitted)
             
         Returns:
             True if successful, False otherwise
@@ -161,17 +293,20 @@ class ChromaDBManager:
                 batch_docs = documents[i:i + batch_size]
                 batch_metas = metadatas[i:i + batch_size]
                 batch_ids = ids[i:i + batch_size]
+                batch_embeddings = embeddings[i:i + batch_size] if embeddings is not None else None
                 
                 self.collection.add(
                     documents=batch_docs,
                     metadatas=batch_metas,
-                    ids=batch_ids
+                    ids=batch_ids,
+                    embeddings=batch_embeddings
                 )
                 
                 logger.info(f"Added batch {i//batch_size + 1}/{(len(documents) + batch_size - 1)//batch_size}")
                 
-                # Small delay between batches
-                time.sleep(0.5)
+                # Small delay between batches that ChromaDB embeds itself
+                if embeddings is None:
+                    time.sleep(0.5)
             
             logger.info("Successfully added all documents")
             return True
@@ -180,6 +315,36 @@ class ChromaDBManager:
             logger.error(f"Failed to add documents: {str(e)}")
             return False
     
+    def embed_chunks(self, chunks) -> List[List[float]]:
+        """Embed DocumentChunk objects, reusing cached and duplicate content.
+        
+        Args:
+            chunks: List of DocumentChunk objects
+            
+        Returns:
+            List of embedding vectors, one per chunk
+        """
+        # Look up cached embeddings by content hash
+        hashes = [
+            chunk.metadata.get("content_hash") or ChunkEmbeddingCache.hash_content(chunk.content)
+            for chunk in chunks
+        ]
+        embeddings = self.embedding_cache.get_many(hashes)
+        
+        # Embed each uncached content once, however many chunks share it
+        missing = {}
+        for chunk, content_hash in zip(chunks, hashes):
+            if content_hash not in embeddings and content_hash not in missing:
+                missing[content_hash] = chunk.content
+        
+        if missing:
+            new_embeddings = dict(zip(missing, self.embedding_function(list(missing.values()))))
+            self.embedding_cache.put_many(new_embeddings)
+            embeddings.update(new_embeddings)
+        
+        logger.info(f"Embedded {len(missing)} unique chunks, reused {len(chunks) - len(missing)} from cache or duplicates")
+        return [embeddings[content_hash] for content_hash in hashes]
+    
     def add_document_chunks(self, chunks) -> bool:
         """Add DocumentChunk objects to the collection.
         
@@ -194,21 +359,24 @@ class ChromaDBManager:
             documents = [chunk.content for chunk in chunks]
             metadatas = [chunk.metadata for chunk in chunks]
             ids = [chunk.chunk_id for chunk in chunks]
+            embeddings = self.embed_chunks(chunks)
             
-            return self.add_documents(documents, metadatas, ids)
+            return self.add_documents(documents, metadatas, ids, embeddings=embeddings)
             
         except Exception as e:
             logger.error(f"Failed to add document chunks: {str(e)}")
             return False
     
     def query_documents(self, query_text: str, n_results: int = None, 
-                       where: Dict[str, Any] = None) -> Dict[str, Any]:
+                       where: Dict[str, Any] = None,
+                       query_embedding: Optional[List[float]] = None) -> Dict[str, Any]:
         """Query documents from the collection.
         
         Args:
             query_text: Query text
             n_results: Number of results to return
             where: Metadata filter conditions
+            query_embedding: Optional precomputed embedding of query_text
             
         Returns:
             Query results dictionary
@@ -217,11 +385,18 @@ class ChromaDBManager:
             if n_results is None:
                 n_results = settings.default_k
             
-            results = self.collection.query(
-                query_texts=[query_text],
-                n_results=n_results,
-                where=where
-            )
+            if query_embedding is not None:
+                results = self.collection.query(
+                    query_embeddings=[query_embedding],
+                    n_results=n_results,
+                    where=where
+                )
+            else:
+                results = self.collection.query(
+                    query_texts=[query_text],
+                    n_results=n_results,
+                    where=where
+                )
             
             logger.info(f"Query returned {len(results['documents'][0])} results")
             return results
@@ -29,12 +29,14 @@ class Settings(BaseSettings):
     # ChromaDB Configuration
     chroma_collection_name: str = Field(default="financial_documents", env="CHROMA_COLLECTION_NAME")
     chroma_distance_function: str = Field(default="cosine", env="CHROMA_DISTANCE_FUNCTION")
+    embedding_cache_path: Path = Field(default=Path("./chroma_db/embedding_cache.sqlite3"), env="EMBEDDING_CACHE_PATH")
     # ChromaDB always runs in embedded mode
     
     # Embedding Configuration - Default to Google
     embedding_model: str = Field(default="text-embedding-004", env="EMBEDDING_MODEL")
     embedding_provider: str = Field(default="google", env="EMBEDDING_PROVIDER")  # google, sentence-transformers
     embedding_dimensions: int = Field(default=768, env="EMBEDDING_DIMENSIONS")
+    embed_batch_size: int = Field(default=256, env="EMBED_BATCH_SIZE")
     
     # LLM Configuration - Default to Google
     llm_model: str = Field(default="gemini-1.5-flash", env="LLM_MODEL")
@@ -50,6 +52,11 @@ class Settings(BaseSettings):
     default_k: int = Field(default=5, env="DEFAULT_K")
     max_k: int = Field(default=20, env="MAX_K")
     
+    # Semantic Query Cache Configuration
+    semantic_cache_size: int = Field(default=512, env="SEMANTIC_CACHE_SIZE")
+    semantic_cache_threshold: float = Field(default=0.95, env="SEMANTIC_CACHE_THRESHOLD")
+    semantic_cache_ttl: int = Field(default=7 * 24 * 3600, env="SEMANTIC_CACHE_TTL")  # seconds
+    
     # Processing Configuration
     batch_size: int = Field(default=10, env="BATCH_SIZE")
     max_workers: int = Field(default=4, env="MAX_WORKERS")
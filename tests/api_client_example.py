@@ -4,112 +4,331 @@ Example client for the House Finance Document API
 Demonstrates how to interact with the FastAPI server
 """
 
-import requests
-import json
+import asyncio
+import functools
+import httpx
+import ijson
+import os
+import socket
+import orjson
+from cachetools import TTLCache
 import sys
+import uuid
 from pathlib import Path
 
+# httpx decodes brotli responses only when the brotli package is installed
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = "gzip, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip"
+
 # API base URL
 BASE_URL = "http://localhost:8000"
 
+# Retry policy for transient gateway errors
+RETRY_STATUSES = frozenset({502, 503, 504})
+# Only requests that are safe to repeat are retried on those statuses; a
+# 504 on /upload or /ingest-directory may mean the work is still running
+RETRY_SAFE_METHODS = frozenset({"GET", "DELETE"})
+RETRY_SAFE_POSTS = frozenset({"/search", "/search-batch"})
+MAX_RETRIES = 5
+BACKOFF_FACTOR = 0.3
+
+class APIError(Exception):
+    """Raised when the API answers with an error status"""
+    
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(f"HTTP {status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+def _parse_response(response: httpx.Response):
+    """Decode a JSON response body, raising APIError for 4xx/5xx statuses"""
+    if response.status_code >= 400:
+        raise APIError(response.status_code, response.text)
+    return orjson.loads(response.content)
+
+@functools.lru_cache(maxsize=1)
+def _get_client() -> httpx.AsyncClient:
+    """Build the connection pool shared by every DocumentAPIClient"""
+    # Pooled keep-alive HTTP/2 connections; the transport retries failed connects.
+    # TCP_NODELAY sends small JSON requests immediately instead of waiting on Nagle.
+    # Reads are unbounded because ingestion requests can run for minutes.
+    transport = httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        retries=MAX_RETRIES,
+        socket_options=[(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)]
+    )
+    return httpx.AsyncClient(
+        transport=transport,
+        headers={"Accept-Encoding": ACCEPT_ENCODING},
+        timeout=httpx.Timeout(10.0, read=None)
+    )
+
 class DocumentAPIClient:
-    """Client for interacting with the Document API"""
+    """Client for interacting with the Document API
+    
+    Error statuses from the server raise APIError; connection failures
+    propagate as httpx.TransportError.
+    """
+    
+    # Pre-serialized /search body; only the values are spliced in per call
+    _SEARCH_TEMPLATE = b'{"query":%s,"n_results":%d,"include_metadata":%s}'
     
     def __init__(self, base_url: str = BASE_URL):
         self.base_url = base_url.rstrip('/')
+        self.client = _get_client()
+        
+        # Short-lived caches for repeated searches and slow-changing stats
+        self._search_cache = TTLCache(maxsize=256, ttl=120)
+        self._stats_cache = TTLCache(maxsize=1, ttl=10)
+        
+        # Server identity only changes on restart; failures are never cached
+        self._health_cache = TTLCache(maxsize=1, ttl=30)
+    
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send a request, retrying transient gateway errors with exponential backoff.
+        
+        Only GET, DELETE and the read-only search POSTs are retried on gateway
+        errors. POSTs carry an X-Request-ID for correlating client and proxy
+        logs; the server does not deduplicate on it.
+        """
+        if method == "POST":
+            kwargs.setdefault("headers", {})["X-Request-ID"] = uuid.uuid4().hex
+        
+        # Encode JSON bodies with orjson rather than the stdlib encoder
+        if "json" in kwargs:
+            kwargs["content"] = orjson.dumps(kwargs.pop("json"))
+            kwargs.setdefault("headers", {})["Content-Type"] = "application/json"
+        
+        retries = MAX_RETRIES if method in RETRY_SAFE_METHODS or url in RETRY_SAFE_POSTS else 0
+        for attempt in range(retries + 1):
+            response = await self.client.request(method, self.base_url + url, **kwargs)
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                return response
+            
+            retry_after = response.headers.get("Retry-After", "")
+            delay = float(retry_after) if retry_after.isdigit() else BACKOFF_FACTOR * (2 ** attempt)
+            await asyncio.sleep(delay)
+    
+    def clear_cache(self):
+        """Drop cached search results and stats"""
+        self._search_cache.clear()
+        self._stats_cache.clear()
+    
+    async def close(self):
+        """Release this client; the shared connection pool stays open for other instances"""
+        self.clear_cache()
+    
+    @classmethod
+    async def shutdown(cls):
+        """Close the shared connection pool.
+        
+        The pool is bound to the event loop that first used it, so call this
+        before that loop exits. The next client builds a fresh pool.
+        """
+        if _get_client.cache_info().currsize:
+            client = _get_client()
+            _get_client.cache_clear()
+            await client.aclose()
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
         
-    def health_check(self):
+    async def health_check(self):
         """Check if the API server is running"""
+        if "health" in self._health_cache:
+            return self._health_cache["health"]
+        
         try:
-            response = requests.get(f"{self.base_url}/")
-            response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
+            response = await self._request("GET", "/")
+        except httpx.TransportError as e:
             print(f"❌ API server not accessible: {e}")
             return None
+        
+        health = _parse_response(response)
+        self._health_cache["health"] = health
+        return health
     
-    def get_stats(self):
+    async def get_stats(self):
         """Get collection statistics"""
-        try:
-            response = requests.get(f"{self.base_url}/stats")
-            response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
-            print(f"❌ Error getting stats: {e}")
-            return None
+        if "stats" in self._stats_cache:
+            return self._stats_cache["stats"]
+        
+        response = await self._request("GET", "/stats")
+        stats = _parse_response(response)
+        self._stats_cache["stats"] = stats
+        return stats
     
-    def search_documents(self, query: str, n_results: int = 5, include_metadata: bool = True):
-        """Search for documents"""
-        try:
+    async def search_documents(self, query: str, n_results: int = 5, include_metadata: bool = True,
+                               stream: bool = False):
+        """Search for documents
+        
+        With stream=True, returns an async iterator that yields each result as it
+        is parsed from the response body, instead of the whole response dict.
+        """
+        if stream:
+            return self._stream_search_results(self._search_body(query, n_results, include_metadata))
+        
+        cache_key = (query, n_results, include_metadata)
+        if cache_key in self._search_cache:
+            return self._search_cache[cache_key]
+        
+        response = await self._request(
+            "POST", "/search",
+            content=self._search_body(query, n_results, include_metadata),
+            headers={"Content-Type": "application/json"}
+        )
+        results = _parse_response(response)
+        
+        # Don't pin empty results, which go stale as soon as documents are added
+        if results["total_results"] > 0:
+            self._search_cache[cache_key] = results
+        return results
+    
+    def _search_body(self, query: str, n_results: int, include_metadata: bool) -> bytes:
+        """Fill the /search body template"""
+        return self._SEARCH_TEMPLATE % (
+            orjson.dumps(query),
+            n_results,
+            b"true" if include_metadata else b"false"
+        )
+    
+    async def _stream_search_results(self, body: bytes):
+        """Yield search results one at a time while the response is still arriving"""
+        headers = {"Content-Type": "application/json", "X-Request-ID": uuid.uuid4().hex}
+        async with self.client.stream("POST", self.base_url + "/search", content=body, headers=headers) as response:
+            if response.status_code >= 400:
+                await response.aread()
+                raise APIError(response.status_code, response.text)
+            
+            # Push-based parser: feed raw chunks in, collect completed result objects
+            parsed = ijson.sendable_list()
+            parser = ijson.items_coro(parsed, "results.item", use_float=True)
+            async for chunk in response.aiter_bytes():
+                parser.send(chunk)
+                for result in parsed:
+                    yield result
+                del parsed[:]
+            parser.close()
+            for result in parsed:
+                yield result
+    
+    async def search_documents_batch(self, queries: list, n_results: int = 5, include_metadata: bool = True):
+        """Search for several queries in a single round trip"""
+        unique_queries = list(dict.fromkeys(queries))
+        found = {}
+        pending = []
+        for query in unique_queries:
+            cache_key = (query, n_results, include_metadata)
+            if cache_key in self._search_cache:
+                found[query] = self._search_cache[cache_key]
+            else:
+                pending.append(query)
+        
+        if pending:
             payload = {
-                "query": query,
+                "queries": pending,
                 "n_results": n_results,
                 "include_metadata": include_metadata
             }
-            response = requests.post(f"{self.base_url}/search", json=payload)
-            response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
-            print(f"❌ Error searching: {e}")
-            return None
+            response = await self._request("POST", "/search-batch", json=payload)
+            if response.status_code == 404:
+                # Server predates /search-batch, so fall back to one request per query
+                results = await asyncio.gather(
+                    *(self.search_documents(query, n_results, include_metadata) for query in pending)
+                )
+            else:
+                results = _parse_response(response)["results"]
+                for query, result in zip(pending, results):
+                    if result["total_results"] > 0:
+                        self._search_cache[(query, n_results, include_metadata)] = result
+            found.update(zip(pending, results))
+        
+        return [found[query] for query in queries]
     
-    def ingest_directory(self, directory_path: str):
+    async def ingest_directory(self, directory_path: str):
         """Ingest documents from a directory"""
-        try:
-            params = {"directory_path": directory_path}
-            response = requests.post(f"{self.base_url}/ingest-directory", params=params)
-            response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
-            print(f"❌ Error ingesting directory: {e}")
-            return None
+        params = {"directory_path": directory_path}
+        response = await self._request("POST", "/ingest-directory", params=params)
+        result = _parse_response(response)
+        self.clear_cache()
+        return result
     
-    def upload_files(self, file_paths: list):
-        """Upload files to the API"""
-        try:
-            files = []
-            for file_path in file_paths:
-                if Path(file_path).exists():
-                    files.append(('files', open(file_path, 'rb')))
-                else:
-                    print(f"⚠️  File not found: {file_path}")
-            
-            if not files:
-                print("❌ No valid files to upload")
-                return None
-            
-            response = requests.post(f"{self.base_url}/upload", files=files)
-            
-            # Close file handles
-            for _, file_handle in files:
-                file_handle.close()
-            
-            response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
-            print(f"❌ Error uploading files: {e}")
+    async def upload_files(self, file_paths: list, workers: int = 4):
+        """Upload files to the API, one request per file with up to `workers` in flight
+        
+        Returns the API response for each uploaded file, or None where that upload failed.
+        """
+        if not file_paths:
+            print("❌ No files to upload")
             return None
+        
+        semaphore = asyncio.Semaphore(workers)
+        
+        async def upload_one(file_path):
+            async with semaphore:
+                try:
+                    with open(file_path, 'rb') as file_handle:
+                        # httpx streams file objects in fixed-size pieces instead of buffering them
+                        files = {'files': (Path(file_path).name, file_handle, 'application/octet-stream')}
+                        response = await self._request("POST", "/upload", files=files)
+                    
+                    result = _parse_response(response)
+                    self.clear_cache()
+                    return result
+                except FileNotFoundError:
+                    print(f"⚠️  File not found: {file_path}")
+                    return None
+                except (OSError, APIError, httpx.TransportError) as e:
+                    print(f"❌ Error uploading {file_path}: {e}")
+                    return None
+        
+        return await asyncio.gather(*[upload_one(file_path) for file_path in file_paths])
+    
+    @staticmethod
+    def files_in_directory(dir_path: str) -> list:
+        """List the regular files directly inside a directory, ready for upload_files
+        
+        Uses os.scandir so file types come from the directory entries without a stat per file.
+        """
+        with os.scandir(dir_path) as entries:
+            return [entry.path for entry in entries if entry.is_file()]
     
-    def reset_collection(self):
+    async def reset_collection(self):
         """Reset the document collection"""
-        try:
-            response = requests.delete(f"{self.base_url}/reset")
-            response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
-            print(f"❌ Error resetting collection: {e}")
-            return None
+        response = await self._request("DELETE", "/reset")
+        result = _parse_response(response)
+        self.clear_cache()
+        return result
 
-def main():
+async def main():
     """Example usage of the API client"""
-    client = DocumentAPIClient()
-    
+    try:
+        async with DocumentAPIClient() as client:
+            await run_examples(client)
+    except APIError as e:
+        print(f"❌ API request failed with status {e.status_code}: {e.detail}")
+    except httpx.TransportError:
+        # health_check already reported the connection error itself
+        print("❌ API server is not running. Start it with: python run_api.py")
+    finally:
+        await DocumentAPIClient.shutdown()
+
+async def run_examples(client: DocumentAPIClient):
+    """Run the example calls against the API"""
     print("🔍 House Finance Document API Client Example")
     print("=" * 50)
     
-    # Health check
+    # Health check and stats are independent, so fetch them concurrently
+    health, stats = await asyncio.gather(client.health_check(), client.get_stats())
+    
     print("\n1. Health Check")
-    health = client.health_check()
     if health:
         print(f"✅ API Status: {health['status']}")
         print(f"📊 Embedding Model: {health['embedding_model']}")
@@ -120,7 +339,6 @@ def main():
     
     # Get stats
     print("\n2. Collection Statistics")
-    stats = client.get_stats()
     if stats:
         print(f"📚 Collection: {stats['collection_name']}")
         print(f"📄 Documents: {stats['document_count']}")
@@ -133,15 +351,20 @@ def main():
         query = "budget allocation for education"
         print(f"🔍 Searching for: '{query}'")
         
-        results = client.search_documents(query, n_results=3)
+        results = await client.search_documents(query, n_results=3)
         if results:
-            print(f"📊 Found {results['total_results']} results:")
+            # Assemble the whole listing and write it once instead of print() per line
+            lines = [f"📊 Found {results['total_results']} results:\n"]
             for i, result in enumerate(results['results'], 1):
-                print(f"\n   Result {i} (Score: {result['score']:.3f}):")
-                print(f"   ID: {result['id']}")
-                print(f"   Content: {result['content'][:200]}...")
+                lines.append(
+                    f"\n   Result {i} (Score: {result['score']:.3f}):\n"
+                    f"   ID: {result['id']}\n"
+                    f"   Content: {result['content'][:200]}...\n"
+                )
                 if result['metadata']:
-                    print(f"   Metadata: {json.dumps(result['metadata'], indent=6)}")
+                    lines.append(f"   Metadata: {orjson.dumps(result['metadata'], option=orjson.OPT_INDENT_2).decode()}\n")
+            sys.stdout.write("".join(lines))
+            sys.stdout.flush()
     else:
         print("\n3. No documents in collection")
         print("💡 To ingest documents, you can:")
@@ -154,4 +377,4 @@ def main():
     print("🔍 Interactive API at: http://localhost:8000/redoc")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    asyncio.run(main()) 
\ No newline at end of file